@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+Collect the shared-library dependencies of a plugin binary.
+
+Walks the dependency graph reported by ldd, copies every non-system
+library next to the plugin binary (or into --output-directory), and
+writes a win32 side-by-side assembly manifest listing the copied
+libraries (see INRIA.IO.manifest at the top of the tree for the
+manifest shipped with the IO plugin bundle).
+
+Works both on Linux and under an MSYS2 shell on Windows, where ldd
+also reports DLL dependencies and cygpath is used to turn MSYS paths
+into mixed-style Windows paths.
+
+Usage:
+  copyDeps.py IO.ofx --output-directory /path/to/bundle/Contents/Win64 \
+      --search-directory /mingw64/bin
+"""
+
+import argparse
+import functools
+import os
+import re
+import shutil
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+# Libraries provided by the base system on every target platform; these
+# must not be bundled with the plugin. The frozenset catches the usual
+# "<stem>.so[.N]" SONAMEs with a single hash lookup; the compiled
+# alternation stays as a fallback for odd SONAME spellings.
+SYSTEM_LIB_PREFIXES = frozenset([
+    "libc", "libdl", "libdrm", "libm", "libpthread", "libresolv",
+    "libselinux", "libudev", "libGL", "libGLX", "libGLdispatch", "libX11",
+    "libXau", "libXdmcp", "libXext", "libXfixes", "libXrender",
+])
+SYSTEM_LIB_PATTERN = re.compile(
+    r"^(?:libc|libdl|libdrm|libm|libpthread|libresolv|libselinux|libudev"
+    r"|libGL|libGLX|libGLdispatch|libX11|libXau|libXdmcp|libXext|libXfixes"
+    r"|libXrender)\.so")
+
+# Windows system DLLs resolved by the MSYS ldd.
+WINDOWS_SYSTEM_PATTERN = re.compile(r"/c/windows/(system|winsxs)", re.IGNORECASE)
+
+is_msys = "MSYSTEM" in os.environ
+
+# BFS colors: undiscovered / queued in a frontier / processed.
+WHITE, GRAY, BLACK = 0, 1, 2
+
+# "path:" separator lines ldd emits between targets when given several
+# binaries, and the "name => location (address)" dependency lines. The
+# section path is matched greedily because mixed-style Windows paths
+# contain a colon themselves; the lookup against the known binary paths
+# in get_deps_for_binary rejects false positives.
+LDD_SECTION_PATTERN = re.compile(r"^(.+):$")
+LDD_LINE_PATTERN = re.compile(r"^(\S+) => (.+?)(?: \(0x[0-9a-f]+\))?$")
+
+
+@functools.lru_cache(maxsize=None)
+def fix_location(dep_location):
+    """Convert an MSYS path to a mixed-style Windows path (cygpath -m).
+
+    On Linux this is the identity function. Cached because the same
+    library location is reported by ldd once per depending binary, and
+    each conversion costs a cygpath fork/exec.
+    """
+    if not is_msys:
+        return dep_location
+    proc = subprocess.run(["cygpath", "-m", dep_location],
+                          capture_output=True, text=True)
+    return proc.stdout.strip()
+
+
+@functools.lru_cache(maxsize=None)
+def canonical_location(location):
+    """Return the canonical form of location (symlinks resolved).
+
+    Cached so comparing two locations for identity costs a string
+    comparison instead of the two stat syscalls of os.path.samefile.
+    """
+    return os.path.realpath(location)
+
+
+@functools.lru_cache(maxsize=None)
+def get_directory_index(directory):
+    """Return a {file_name: location} index of directory.
+
+    One scandir reads the whole directory, so every later lookup in it
+    is a dict hit instead of a stat syscall. Cached lazily because the
+    directories of discovered binaries join the search path as the walk
+    progresses.
+    """
+    try:
+        # directory is "" when it is the dirname of a bare file name;
+        # scandir needs that spelled as the current directory.
+        with os.scandir(directory or ".") as entries:
+            return dict((e.name, os.path.join(directory, e.name))
+                        for e in entries if e.is_file())
+    except OSError:
+        return {}
+
+
+@functools.lru_cache(maxsize=None)
+def resolve_in_search_directories(dep_name, search_directories):
+    """Return the location of dep_name in search_directories, or None.
+
+    search_directories must be a tuple so lookups can be memoized: the
+    same library is reported by ldd for every binary depending on it.
+    """
+    for x in search_directories:
+        alt_dep_location = get_directory_index(x).get(dep_name)
+        if alt_dep_location is not None:
+            return alt_dep_location
+    return None
+
+
+def get_deps_for_binary(binary_paths, search_directories):
+    """Return the direct dependencies of each binary in binary_paths.
+
+    Runs a single ldd over all of binary_paths (one fork/exec per BFS
+    wave instead of one per binary) and splits the grouped output on
+    the "path:" separator lines ldd emits between targets.
+    search_directories is a tuple so it can be passed straight to the
+    memoized resolver.
+
+    Returns a dict mapping each binary path to a {dep_name:
+    dep_location} dict of its direct dependencies.
+    """
+    proc = subprocess.run(["ldd"] + list(binary_paths),
+                          capture_output=True, text=True)
+    if proc.returncode != 0:
+        # A nonzero status means a binary was missing or not a dynamic
+        # object; carrying on would silently produce an empty bundle.
+        sys.stderr.write(proc.stderr)
+        sys.stderr.write("ldd failed for %s\n" % " ".join(binary_paths))
+        sys.exit(1)
+    deps = dict((x, {}) for x in binary_paths)
+    current_binary = binary_paths[0]
+    for line in proc.stdout.splitlines():
+        line = line.strip()
+        if len(binary_paths) > 1:
+            m = LDD_SECTION_PATTERN.match(line)
+            if m is not None and m.group(1) in deps:
+                current_binary = m.group(1)
+                continue
+        m = LDD_LINE_PATTERN.match(line)
+        if m is None:
+            continue
+        dep_name = m.group(1)
+        ldd_dep_location = m.group(2)
+        if dep_name.partition(".so")[0] in SYSTEM_LIB_PREFIXES:
+            continue
+        if WINDOWS_SYSTEM_PATTERN.search(ldd_dep_location) is not None:
+            continue
+        if SYSTEM_LIB_PATTERN.match(dep_name) is not None:
+            continue
+        if ldd_dep_location == "not found":
+            dep_location = ""
+        else:
+            dep_location = fix_location(ldd_dep_location)
+        if not os.path.exists(dep_location):
+            alt_dep_location = resolve_in_search_directories(
+                dep_name, search_directories)
+            if alt_dep_location is not None:
+                dep_location = alt_dep_location
+        if not os.path.exists(dep_location):
+            sys.stderr.write("could not locate dependency %s of %s\n"
+                             % (dep_name, current_binary))
+            sys.exit(1)
+        deps[current_binary][dep_name] = dep_location
+    return deps
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Copy the shared-library dependencies of a plugin "
+                    "binary and write the matching assembly manifest.")
+    parser.add_argument("binary", help="plugin binary to examine")
+    parser.add_argument("-o", "--output-directory", required=True,
+                        help="directory the dependencies are copied into")
+    parser.add_argument("-L", "--search-directory", action="append", default=[],
+                        help="extra directory searched for dependencies not "
+                             "found at the location ldd reports; may be "
+                             "given several times")
+    parser.add_argument("--assembly-name", default="INRIA.IO",
+                        help="name of the generated assembly manifest "
+                             "(default: %(default)s)")
+    args = parser.parse_args()
+
+    search_directories = tuple(args.search_directory)
+    binary_key_name = os.path.basename(args.binary)
+    binary_name_to_location_map = {binary_key_name: fix_location(args.binary)}
+    full_deps_set = set()
+    state = {binary_key_name: GRAY}
+    frontier = [binary_key_name]
+    while len(frontier) > 0:
+        # Group the BFS wave by directory: binaries sharing a directory
+        # share the same effective search path (their own directory is
+        # searched first) and can go through a single ldd invocation,
+        # and the groups are independent, so resolve them in parallel.
+        # ldd work is fork- and I/O-bound, so threads scale fine here.
+        frontier_groups = {}
+        for x in frontier:
+            state[x] = BLACK
+            binary_dir = os.path.dirname(binary_name_to_location_map[x])
+            frontier_groups.setdefault(binary_dir, []).append(x)
+
+        def resolve_group(group):
+            binary_dir, names = group
+            paths = [binary_name_to_location_map[x] for x in names]
+            # Libraries living next to a binary take precedence.
+            return get_deps_for_binary(paths, (binary_dir,) + search_directories)
+
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+            group_results = list(executor.map(resolve_group,
+                                              sorted(frontier_groups.items())))
+        wave_deps = {}
+        for result in group_results:
+            wave_deps.update(result)
+        # Merge after the wave completes, single-threaded, so the
+        # duplicate-location check below stays deterministic.
+        next_frontier = []
+        for x in frontier:
+            deps = wave_deps[binary_name_to_location_map[x]]
+            for dep_name, dep_location in deps.items():
+                full_deps_set.add(dep_name)
+                if dep_name in binary_name_to_location_map:
+                    existing_location = binary_name_to_location_map[dep_name]
+                    if canonical_location(existing_location) != canonical_location(dep_location):
+                        sys.stderr.write("dependency %s found both at %s and %s\n"
+                                         % (dep_name, existing_location, dep_location))
+                        sys.exit(1)
+                else:
+                    binary_name_to_location_map[dep_name] = dep_location
+                if state.get(dep_name, WHITE) == WHITE:
+                    state[dep_name] = GRAY
+                    next_frontier.append(dep_name)
+        frontier = sorted(next_frontier)
+
+    full_deps_list = sorted(full_deps_set - set([binary_key_name]))
+
+    def copy_dep(dep_name):
+        # Copy the symlink target under the dependency's own name, with
+        # copyfile rather than copy: the mode fixup of copy is useless
+        # for bundled libraries, and copyfile goes through the kernel
+        # zero-copy path on Linux.
+        shutil.copyfile(canonical_location(binary_name_to_location_map[dep_name]),
+                        os.path.join(args.output_directory, dep_name))
+
+    if len(full_deps_list) > 0:
+        # Copies are I/O-bound; overlapping them hides the per-file
+        # read/write latency.
+        with ThreadPoolExecutor(max_workers=min(16, len(full_deps_list))) as executor:
+            list(executor.map(copy_dep, full_deps_list))
+
+    manifest_parts = [
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>',
+        '<assembly xmlns="urn:schemas-microsoft-com:asm.v1" manifestVersion="1.0">',
+        '<assemblyIdentity name="%s" version="1.0.0.0" type="win32" '
+        'processorArchitecture="amd64"/>' % args.assembly_name,
+    ]
+    manifest_parts.extend('  <file name="%s"></file>' % x for x in full_deps_list)
+    manifest_parts.append('</assembly>\n')
+    manifest_path = os.path.join(args.output_directory,
+                                 args.assembly_name + ".manifest")
+    with open(manifest_path, "w") as write_file:
+        write_file.write("\n".join(manifest_parts))
+
+
+if __name__ == "__main__":
+    main()